@@ -11,16 +11,32 @@ Usage:
     python layout_parser.py                     # Full pipeline
     python layout_parser.py --setup             # Create processor (one-time)
     python layout_parser.py --list-processors   # List existing processors
+    python layout_parser.py --file big.pdf --batch  # Large PDF via GCS batch processing
 """
 
 from google.cloud import documentai_v1 as documentai
 from google.cloud import storage
 from google.api_core.client_options import ClientOptions
+from google.auth.transport.requests import Request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+import google.auth
 import argparse
+import base64
+import functools
+import hashlib
+import heapq
+import io
+import mmap
+import orjson
 import os
 import re
 import tempfile
-from pypdf import PdfReader, PdfWriter
+import threading
+import types
+import uuid
+import httpx
+import pikepdf
 
 # ============ CONFIGURE THESE ============
 PROJECT_ID = "your-gcp-project"  # TODO: Your GCP project ID
@@ -32,13 +48,76 @@ PROCESSOR_ID = None  # TODO: Set after running --setup
 
 INPUT_GCS_URI = f"gs://{BUCKET}/test_docs/"  # Folder with documents
 OUTPUT_PREFIX = "parsed_output/"
+
+# Concurrent online requests when processing split PDFs (processor quota is 60 req/min)
+MAX_WORKERS = 8
+
+# Local cache for Document AI responses and converted markdown
+# (set to None or pass --no-cache to disable)
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "gcp-doc-parser"
+)
+# Per cache limits; least recently used entries are evicted past either one
+CACHE_MAX_ENTRIES = 1000
+CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Raw responses can be several MB per chunk
 # ==========================================
 
+# Bump when document_to_markdown output changes so stale cache entries are ignored
+MARKDOWN_CACHE_VERSION = 2
+
+# Read-only extension -> MIME type map, built once at import
+MIME_TYPES = types.MappingProxyType({
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".xlsm": "application/vnd.ms-excel.sheet.macroenabled.12",
+    ".html": "text/html",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".tiff": "image/tiff",
+    ".gif": "image/gif",
+})
+
+# Table cells are flattened to one line
+NEWLINE_TO_SPACE = str.maketrans({"\n": " "})
+
+# Resumable GCS uploads are sent in pieces of this size (must be a multiple of 256 KB)
+GCS_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Shared HTTP/2 client: keeps connections warm and multiplexes concurrent chunk requests
+HTTP_CLIENT = httpx.Client(
+    http2=True, timeout=300, limits=httpx.Limits(max_keepalive_connections=16)
+)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_documentai_client(location: str) -> documentai.DocumentProcessorServiceClient:
+    """Get the shared Document AI client for a location, creating it on first use"""
+    with _clients_lock:
+        key = ("documentai", location)
+        if key not in _clients:
+            opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
+            _clients[key] = documentai.DocumentProcessorServiceClient(client_options=opts)
+        return _clients[key]
+
+
+def get_storage_client(project_id: str) -> storage.Client:
+    """Get the shared Cloud Storage client for a project, creating it on first use"""
+    with _clients_lock:
+        key = ("storage", project_id)
+        if key not in _clients:
+            _clients[key] = storage.Client(project=project_id)
+        return _clients[key]
+
 
 def create_processor(project_id: str, location: str, display_name: str = "layout-parser-md"):
     """Create a Layout Parser processor (one-time setup)"""
-    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    client = get_documentai_client(location)
 
     parent = client.common_location_path(project_id, location)
 
@@ -58,8 +137,7 @@ def create_processor(project_id: str, location: str, display_name: str = "layout
 
 def list_processors(project_id: str, location: str):
     """List all Document AI processors"""
-    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    client = get_documentai_client(location)
 
     parent = client.common_location_path(project_id, location)
     processors = client.list_processors(parent=parent)
@@ -73,6 +151,29 @@ def list_processors(project_id: str, location: str):
         print()
 
 
+_credentials = None
+_credentials_lock = threading.Lock()
+
+
+def get_auth_headers() -> dict:
+    """Get auth headers from ADC, refreshing the token only when it has expired
+
+    Uses credentials.apply() so the quota project (x-goog-user-project) is sent
+    along with the bearer token, which user ADC needs for Document AI.
+    """
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials, _ = google.auth.default(
+                scopes=["https://www.googleapis.com/auth/cloud-platform"]
+            )
+        if not _credentials.valid:
+            _credentials.refresh(Request())
+        headers = {}
+        _credentials.apply(headers)
+        return headers
+
+
 def process_document_online(
     project_id: str,
     location: str,
@@ -81,42 +182,58 @@ def process_document_online(
     mime_type: str,
 ) -> dict:
     """Process a single document using REST API (online, up to 20MB)"""
-    import subprocess
-    import requests
-    import base64
-
-    # Get access token from gcloud
-    token = subprocess.check_output(
-        ["gcloud", "auth", "print-access-token"], text=True
-    ).strip()
-
-    # Read and encode file
+    # Read file (mmap avoids an intermediate copy of the raw bytes)
     with open(file_path, "rb") as f:
-        content = base64.b64encode(f.read()).decode("utf-8")
+        if os.fstat(f.fileno()).st_size:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = f.read()  # Empty files can't be mmapped
+
+    try:
+        # Reuse a previous response for identical bytes sent to the same processor
+        file_hash = hashlib.sha256(data).hexdigest()
+        cache_key = hashlib.sha256(
+            f"{project_id}:{location}:{processor_id}:{mime_type}:{file_hash}".encode()
+        ).hexdigest() + ".json"
+        cached = cache_get("responses", cache_key)
+        if cached is not None:
+            return orjson.loads(cached)
+
+        content = base64.b64encode(data).decode("ascii")
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+    # Serialize once up front so the body is sent as-is
+    body = orjson.dumps({
+        "rawDocument": {
+            "content": content,
+            "mimeType": mime_type,
+        }
+    })
+    del content
 
     # API endpoint
     url = f"https://{location}-documentai.googleapis.com/v1/projects/{project_id}/locations/{location}/processors/{processor_id}:process"
 
     # Make request
-    response = requests.post(
+    response = HTTP_CLIENT.post(
         url,
         headers={
-            "Authorization": f"Bearer {token}",
+            **get_auth_headers(),
             "Content-Type": "application/json",
         },
-        json={
-            "rawDocument": {
-                "content": content,
-                "mimeType": mime_type,
-            }
-        },
-        timeout=300,
+        content=body,
     )
 
     if response.status_code != 200:
         raise Exception(f"API error {response.status_code}: {response.text}")
 
-    return response.json()
+    # Parse the raw bytes with orjson rather than decoding to str for stdlib json
+    result = orjson.loads(response.content)
+    # Best-effort: a cache failure must not discard a successful (billed) response
+    cache_put("responses", cache_key, response.content)
+    return result
 
 
 def process_document_gcs(
@@ -128,15 +245,32 @@ def process_document_gcs(
     mime_type: str,
 ) -> str:
     """Process document from GCS (batch, for large files)"""
-    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    batch_process_gcs(
+        project_id, location, processor_id, [gcs_input_uri], gcs_output_uri, mime_type
+    )
+    return gcs_output_uri
+
+
+def batch_process_gcs(
+    project_id: str,
+    location: str,
+    processor_id: str,
+    gcs_input_uris: list[str],
+    gcs_output_uri: str,
+    mime_type: str,
+    timeout: int = 300,
+) -> documentai.BatchProcessMetadata:
+    """Process several GCS documents in one batch request. Returns operation metadata."""
+    client = get_documentai_client(location)
 
     name = client.processor_path(project_id, location, processor_id)
 
     # Input config
-    gcs_document = documentai.GcsDocument(gcs_uri=gcs_input_uri, mime_type=mime_type)
+    gcs_documents = [
+        documentai.GcsDocument(gcs_uri=uri, mime_type=mime_type) for uri in gcs_input_uris
+    ]
     input_config = documentai.BatchDocumentsInputConfig(
-        gcs_documents=documentai.GcsDocuments(documents=[gcs_document])
+        gcs_documents=documentai.GcsDocuments(documents=gcs_documents)
     )
 
     # Output config
@@ -157,12 +291,132 @@ def process_document_gcs(
     print(f"Batch processing started: {operation.operation.name}")
     print("Waiting for completion...")
 
-    operation.result(timeout=300)
+    try:
+        operation.result(timeout=timeout)
+    except FuturesTimeoutError:
+        operation.cancel()
+        raise TimeoutError(
+            f"Batch operation {operation.operation.name} did not finish within {timeout}s; "
+            f"cancellation requested. Output objects may still be written under {gcs_output_uri}"
+        ) from None
     print("✓ Batch processing complete")
 
-    return gcs_output_uri
+    return operation.metadata
+
+
+_cache_warned = False
+
+
+def warn_cache_error(error: OSError) -> None:
+    """Report a cache failure once; the cache is best-effort and never fails a run"""
+    global _cache_warned
+    if not _cache_warned:
+        _cache_warned = True
+        print(f"Warning: local cache unavailable, continuing without it ({error})")
+
+
+def cache_get(namespace: str, key: str) -> bytes | None:
+    """Read an entry from the local cache, marking it as recently used"""
+    if not CACHE_DIR:
+        return None
+    path = os.path.join(CACHE_DIR, namespace, key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        warn_cache_error(e)
+        return None
+    return data
+
+
+def cache_put(namespace: str, key: str, data: bytes) -> None:
+    """Write an entry to the local cache, evicting least recently used entries"""
+    if not CACHE_DIR:
+        return
+    directory = os.path.join(CACHE_DIR, namespace)
+    temp_path = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temp file and rename so concurrent readers never see partial data
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, os.path.join(directory, key))
+        temp_path = None
+
+        evict_cache_entries(directory)
+    except OSError as e:
+        warn_cache_error(e)
+    finally:
+        if temp_path is not None:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+
+
+def evict_cache_entries(directory: str) -> None:
+    """Remove least recently used entries beyond CACHE_MAX_ENTRIES or CACHE_MAX_BYTES"""
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".tmp"):
+            continue
+        try:
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass  # Evicted by another worker since the scan
+
+    total_bytes = sum(size for _, size, _ in entries)
+    if len(entries) <= CACHE_MAX_ENTRIES and total_bytes <= CACHE_MAX_BYTES:
+        return
+
+    entries.sort()
+    count = len(entries)
+    for _, size, path in entries:
+        if count <= CACHE_MAX_ENTRIES and total_bytes <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        count -= 1
+        total_bytes -= size
+
+
+def cached_markdown(func):
+    """Cache markdown conversions on disk, keyed by a hash of the response"""
+    @functools.wraps(func)
+    def wrapper(response: dict) -> str:
+        digest = hashlib.blake2b(orjson.dumps(response), digest_size=20)
+        digest.update(str(MARKDOWN_CACHE_VERSION).encode())
+        key = f"{digest.hexdigest()}.md"
+
+        cached = cache_get("markdown", key)
+        if cached is not None:
+            return cached.decode("utf-8")
+
+        markdown = func(response)
+        cache_put("markdown", key, markdown.encode("utf-8"))
+        return markdown
 
+    return wrapper
 
+
+def _iter_text(blocks: list[dict]):
+    """Yield the text of text blocks, including nested ones, in document order"""
+    for block in blocks:
+        text_block = block.get("textBlock")
+        if text_block:
+            yield text_block.get("text", "")
+            yield from _iter_text(text_block.get("blocks", []))
+
+
+@cached_markdown
 def document_to_markdown(response: dict) -> str:
     """Convert Document AI JSON response to Markdown"""
     md_parts = []
@@ -171,10 +425,19 @@ def document_to_markdown(response: dict) -> str:
     layout = document.get("documentLayout", {})
     blocks = layout.get("blocks", [])
 
-    def process_block(block, depth=0):
-        """Recursively process a block and its children"""
-        parts = []
+    # Walk blocks depth-first with an explicit stack, appending each block's
+    # markdown to one flat list that is joined once at the end.
+    stack = [(block, 0) for block in reversed(blocks)]
+    # Depths of empty-text blocks on the current path; like the recursive
+    # join they only contribute a blank entry if a descendant has content
+    pending = []
 
+    while stack:
+        block, depth = stack.pop()
+        while pending and pending[-1] >= depth:
+            pending.pop()
+
+        text = ""
         if "textBlock" in block:
             text_block = block["textBlock"]
             text = text_block.get("text", "")
@@ -182,21 +445,18 @@ def document_to_markdown(response: dict) -> str:
 
             # Format based on type
             if block_type == "heading-1":
-                parts.append(f"# {text}")
+                text = f"# {text}"
             elif block_type == "heading-2":
-                parts.append(f"## {text}")
+                text = f"## {text}"
             elif block_type == "heading-3":
-                parts.append(f"### {text}")
-            elif block_type == "paragraph":
-                parts.append(text)
-            else:
-                parts.append(text)
-
-            # Process nested blocks
-            for child in text_block.get("blocks", []):
-                child_md = process_block(child, depth + 1)
-                if child_md:
-                    parts.append(child_md)
+                text = f"### {text}"
+
+            # Process nested blocks (pushed in reverse so they pop in order)
+            children = text_block.get("blocks", [])
+            if not text and children:
+                pending.append(depth)
+            for child in reversed(children):
+                stack.append((child, depth + 1))
 
         elif "tableBlock" in block:
             table = block["tableBlock"]
@@ -204,13 +464,7 @@ def document_to_markdown(response: dict) -> str:
 
             # Header rows
             for row in table.get("headerRows", []):
-                cells = []
-                for cell in row.get("cells", []):
-                    cell_text = ""
-                    for cb in cell.get("blocks", []):
-                        if "textBlock" in cb:
-                            cell_text += cb["textBlock"].get("text", "")
-                    cells.append(cell_text)
+                cells = ["".join(_iter_text(cell.get("blocks", []))) for cell in row.get("cells", [])]
                 table_md.append("| " + " | ".join(cells) + " |")
 
             # Separator
@@ -220,16 +474,10 @@ def document_to_markdown(response: dict) -> str:
 
             # Body rows
             for row in table.get("bodyRows", []):
-                cells = []
-                for cell in row.get("cells", []):
-                    cell_text = ""
-                    for cb in cell.get("blocks", []):
-                        if "textBlock" in cb:
-                            cell_text += cb["textBlock"].get("text", "")
-                    cells.append(cell_text)
+                cells = ["".join(_iter_text(cell.get("blocks", []))) for cell in row.get("cells", [])]
                 table_md.append("| " + " | ".join(cells) + " |")
 
-            parts.append("\n".join(table_md))
+            text = "\n".join(table_md)
 
         elif "listBlock" in block:
             list_block = block["listBlock"]
@@ -237,24 +485,19 @@ def document_to_markdown(response: dict) -> str:
             items = []
 
             for i, entry in enumerate(list_block.get("listEntries", [])):
-                item_text = ""
-                for eb in entry.get("blocks", []):
-                    if "textBlock" in eb:
-                        item_text += eb["textBlock"].get("text", "")
+                item_text = "".join(_iter_text(entry.get("blocks", [])))
                 if list_type == "ordered":
                     items.append(f"{i+1}. {item_text}")
                 else:
                     items.append(f"- {item_text}")
 
-            parts.append("\n".join(items))
-
-        return "\n\n".join(parts)
+            text = "\n".join(items)
 
-    # Process all top-level blocks
-    for block in blocks:
-        block_md = process_block(block)
-        if block_md:
-            md_parts.append(block_md)
+        if text:
+            # Empty-text ancestors now have content below them
+            md_parts.extend([""] * len(pending))
+            pending.clear()
+            md_parts.append(text)
 
     # Fall back to raw text if no structured content
     if not md_parts:
@@ -267,51 +510,64 @@ def document_to_markdown(response: dict) -> str:
 
 def get_text_from_layout(layout, full_text: str) -> str:
     """Extract text from a layout element"""
-    if not layout.text_anchor.text_segments:
+    segments = layout.text_anchor.text_segments
+    if not segments:
         return ""
 
-    text_parts = []
-    for segment in layout.text_anchor.text_segments:
-        start = int(segment.start_index) if segment.start_index else 0
-        end = int(segment.end_index)
-        text_parts.append(full_text[start:end])
+    # Most cells are a single contiguous span: slice directly, no join
+    if len(segments) == 1:
+        segment = segments[0]
+        return full_text[int(segment.start_index):int(segment.end_index)]
 
-    return "".join(text_parts)
+    return "".join(
+        full_text[int(segment.start_index):int(segment.end_index)] for segment in segments
+    )
 
 
 def table_to_markdown(table, full_text: str) -> str:
     """Convert Document AI table to Markdown table"""
-    rows = []
+    def cell_to_markdown(cell) -> str:
+        # One pass for newlines; only strip (and copy) when there is edge whitespace
+        text = get_text_from_layout(cell.layout, full_text).translate(NEWLINE_TO_SPACE)
+        if text and (text[0].isspace() or text[-1].isspace()):
+            text = text.strip()
+        return text
 
-    # Header row
-    if table.header_rows:
-        for header_row in table.header_rows:
-            cells = []
-            for cell in header_row.cells:
-                cell_text = get_text_from_layout(cell.layout, full_text).strip()
-                cell_text = cell_text.replace("\n", " ")
-                cells.append(cell_text)
-            rows.append("| " + " | ".join(cells) + " |")
+    def row_to_markdown(row) -> str:
+        return "| " + " | ".join([cell_to_markdown(cell) for cell in row.cells]) + " |"
 
-        # Separator
-        rows.append("| " + " | ".join(["---"] * len(table.header_rows[0].cells)) + " |")
+    # Header rows
+    header_rows = table.header_rows
+    rows = [row_to_markdown(row) for row in header_rows]
+
+    # Separator
+    if header_rows:
+        rows.append("| " + " | ".join(["---"] * len(header_rows[0].cells)) + " |")
 
     # Body rows
-    for body_row in table.body_rows:
-        cells = []
-        for cell in body_row.cells:
-            cell_text = get_text_from_layout(cell.layout, full_text).strip()
-            cell_text = cell_text.replace("\n", " ")
-            cells.append(cell_text)
-        rows.append("| " + " | ".join(cells) + " |")
+    rows.extend(row_to_markdown(row) for row in table.body_rows)
 
     return "\n".join(rows)
 
 
-def split_pdf(file_path: str, max_pages: int = 25) -> list[str]:
-    """Split a PDF into chunks of max_pages each. Returns list of temp file paths."""
-    reader = PdfReader(file_path)
-    total_pages = len(reader.pages)
+def get_pdf_page_count(pdf: pikepdf.Pdf) -> int:
+    """Get page count from the page tree root's /Count, without walking every page"""
+    count = pdf.Root.Pages.get("/Count")
+    if isinstance(count, int) and count >= 0:
+        return count
+    return len(pdf.pages)  # Malformed /Count: fall back to walking the tree
+
+
+def split_pdf(file_path: str, max_pages: int = 25, pdf: pikepdf.Pdf | None = None) -> list[str]:
+    """Split a PDF into chunks of max_pages each. Returns list of temp file paths.
+
+    Pass pdf if file_path is already open to avoid parsing it a second time.
+    """
+    if pdf is None:
+        with pikepdf.open(file_path) as pdf:
+            return split_pdf(file_path, max_pages, pdf)
+
+    total_pages = len(pdf.pages)
 
     if total_pages <= max_pages:
         return [file_path]  # No split needed
@@ -321,85 +577,220 @@ def split_pdf(file_path: str, max_pages: int = 25) -> list[str]:
 
     for start in range(0, total_pages, max_pages):
         end = min(start + max_pages, total_pages)
-        writer = PdfWriter()
-
-        for page_num in range(start, end):
-            writer.add_page(reader.pages[page_num])
-
-        # Create temp file
-        temp_file = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
-        writer.write(temp_file)
-        temp_file.close()
+        with pikepdf.Pdf.new() as dst:
+            dst.pages.extend(pdf.pages[start:end])
+
+            # Create temp file
+            temp_file = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+            temp_file.close()
+            # Deterministic /ID keeps chunk bytes (and response cache keys) stable
+            dst.save(temp_file.name, deterministic_id=True)
         temp_files.append(temp_file.name)
         print(f"  Created chunk {len(temp_files)}: pages {start+1}-{end}")
 
     return temp_files
 
 
+def write_chunks_in_order(results, output_path: str) -> str:
+    """Write (chunk index, markdown) pairs to output_path in chunk order as they arrive.
+
+    A chunk that finishes early is held only until the chunks before it are
+    written, so memory stays bounded by the out-of-order backlog rather than the
+    whole document. The file is written under a .part name and renamed into
+    place once complete.
+    """
+    temp_path = f"{output_path}.part"
+    pending = []  # Heap of chunks that arrived before their predecessors
+    next_index = 0
+
+    try:
+        with open(temp_path, "w") as f:
+            for i, md in results:
+                heapq.heappush(pending, (i, md))
+                while pending and pending[0][0] == next_index:
+                    _, md = heapq.heappop(pending)
+                    if next_index:
+                        f.write("\n\n---\n\n")
+                    f.write(f"<!-- Page chunk {next_index+1} -->\n{md}")
+                    next_index += 1
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    return output_path
+
+
 def process_large_pdf(
     project_id: str,
     location: str,
     processor_id: str,
     file_path: str,
+    output_path: str,
     max_pages: int = 25,
+    max_workers: int = MAX_WORKERS,
+    pdf: pikepdf.Pdf | None = None,
 ) -> str:
-    """Process a large PDF by splitting into chunks and combining results."""
+    """Process a large PDF by splitting into chunks and writing combined results.
+
+    Chunks are sent concurrently; their markdown is streamed to output_path in
+    page order. Returns output_path.
+    """
     # Split PDF
-    chunks = split_pdf(file_path, max_pages)
+    chunks = split_pdf(file_path, max_pages, pdf)
+    print(f"\nProcessing {len(chunks)} chunks ({max_workers} concurrent)...")
 
-    all_markdown = []
-    for i, chunk_path in enumerate(chunks):
-        print(f"\nProcessing chunk {i+1}/{len(chunks)}...")
+    def process_chunk(chunk_path: str) -> str:
         try:
             response = process_document_online(
                 project_id, location, processor_id, chunk_path, "application/pdf"
             )
-            md = document_to_markdown(response)
-            all_markdown.append(f"<!-- Page chunk {i+1} -->\n{md}")
+            return document_to_markdown(response)
         finally:
-            # Clean up temp file (but not original)
+            # Clean up temp file (but not original) as soon as the chunk is done
             if chunk_path != file_path:
                 os.unlink(chunk_path)
 
-    return "\n\n---\n\n".join(all_markdown)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(process_chunk, path): i for i, path in enumerate(chunks)}
+
+        def completed():
+            for future in as_completed(futures):
+                i = futures[future]
+                md = future.result()
+                print(f"  ✓ Chunk {i+1}/{len(chunks)} done")
+                yield i, md
+
+        try:
+            write_chunks_in_order(completed(), output_path)
+        except BaseException:
+            # Don't start remaining chunks; remove temp files they never got to
+            for future, i in futures.items():
+                if future.cancel() and chunks[i] != file_path:
+                    os.unlink(chunks[i])
+            raise
+
+    return output_path
+
+
+def read_batch_output(bucket: storage.Bucket, gcs_uri: str) -> str:
+    """Convert the (possibly sharded) batch output JSON under gcs_uri to Markdown"""
+    prefix = gcs_uri.removeprefix(f"gs://{bucket.name}/").rstrip("/") + "/"
+    shards = [
+        orjson.loads(blob.download_as_bytes())
+        for blob in bucket.list_blobs(prefix=prefix)
+        if blob.name.endswith(".json")
+    ]
+    shards.sort(key=lambda doc: int(doc.get("shardInfo", {}).get("shardIndex", 0)))
+    return "\n\n".join(document_to_markdown({"document": doc}) for doc in shards)
+
+
+def process_large_pdf_gcs(
+    project_id: str,
+    location: str,
+    processor_id: str,
+    file_path: str,
+    output_path: str,
+    bucket_name: str,
+    max_pages: int = 25,
+    max_workers: int = MAX_WORKERS,
+    pdf: pikepdf.Pdf | None = None,
+    timeout: int = 1800,
+) -> str:
+    """Process a large PDF with a single batch request over chunks uploaded to GCS.
+
+    Document AI processes the chunks in parallel server-side, and the file is
+    sent as raw bytes rather than base64. Markdown is streamed to output_path
+    chunk by chunk and temporary GCS objects are deleted afterwards. Returns
+    output_path.
+    """
+    # Split PDF
+    chunks = split_pdf(file_path, max_pages, pdf)
+
+    bucket = get_storage_client(project_id).bucket(bucket_name)
+    prefix = f"tmp/{uuid.uuid4().hex}"
+    input_uris = [f"gs://{bucket_name}/{prefix}/chunk_{i}.pdf" for i in range(len(chunks))]
+
+    def upload_chunk(i: int):
+        blob = bucket.blob(f"{prefix}/chunk_{i}.pdf")
+        blob.upload_from_filename(chunks[i], content_type="application/pdf")
+
+    keep_output = False
+    try:
+        print(f"\nUploading {len(chunks)} chunks to gs://{bucket_name}/{prefix}/...")
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                list(pool.map(upload_chunk, range(len(chunks))))
+        finally:
+            # Clean up temp files (but not original)
+            for chunk_path in chunks:
+                if chunk_path != file_path:
+                    os.unlink(chunk_path)
+
+        try:
+            metadata = batch_process_gcs(
+                project_id, location, processor_id, input_uris,
+                f"gs://{bucket_name}/{prefix}/output/", "application/pdf", timeout=timeout,
+            )
+        except TimeoutError:
+            # The job may still write shards after we give up, so deleting
+            # output/ now would race with it; leave it for manual cleanup
+            keep_output = True
+            raise
+
+        statuses = {st.input_gcs_source: st for st in metadata.individual_process_statuses}
+
+        def results():
+            for i, uri in enumerate(input_uris):
+                status = statuses.get(uri)
+                if status is None:
+                    raise Exception(f"Batch error for chunk {i+1}: no status returned")
+                if status.status.code != 0:
+                    raise Exception(f"Batch error for chunk {i+1}: {status.status.message}")
+                yield i, read_batch_output(bucket, status.output_gcs_destination)
+
+        write_chunks_in_order(results(), output_path)
+    finally:
+        for blob in bucket.list_blobs(prefix=f"{prefix}/"):
+            if keep_output and blob.name.startswith(f"{prefix}/output/"):
+                continue
+            blob.delete()
+
+    return output_path
 
 
 def get_mime_type(file_path: str) -> str:
     """Get MIME type from file extension"""
-    ext = os.path.splitext(file_path)[1].lower()
-    mime_types = {
-        ".pdf": "application/pdf",
-        ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
-        ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        ".xlsm": "application/vnd.ms-excel.sheet.macroenabled.12",
-        ".html": "text/html",
-        ".png": "image/png",
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".tiff": "image/tiff",
-        ".gif": "image/gif",
-    }
-    return mime_types.get(ext, "application/octet-stream")
+    return MIME_TYPES.get(os.path.splitext(file_path)[1].lower(), "application/octet-stream")
 
 
 def save_to_gcs(content: str, bucket_name: str, blob_name: str):
     """Save content to GCS"""
-    client = storage.Client(project=PROJECT_ID)
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_name)
-    blob.upload_from_string(content, content_type="text/markdown")
+    bucket = get_storage_client(PROJECT_ID).bucket(bucket_name)
+    # Chunked resumable upload: a transient failure only retries the current chunk
+    blob = bucket.blob(blob_name, chunk_size=GCS_UPLOAD_CHUNK_SIZE)
+    with io.BytesIO(content.encode("utf-8")) as buf:
+        blob.upload_from_file(buf, content_type="text/markdown")
     print(f"✓ Saved to gs://{bucket_name}/{blob_name}")
 
 
 def main():
+    global CACHE_DIR
+
     parser = argparse.ArgumentParser(description="Document AI Layout Parser to Markdown")
     parser.add_argument("--setup", action="store_true", help="Create Layout Parser processor")
     parser.add_argument("--list-processors", action="store_true", help="List processors")
     parser.add_argument("--file", type=str, help="Local file to process")
     parser.add_argument("--processor-id", type=str, help="Processor ID to use")
+    parser.add_argument("--batch", action="store_true",
+                        help="Process large PDFs with one batch request via GCS (uses BUCKET)")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the local cache")
     args = parser.parse_args()
 
+    if args.no_cache:
+        CACHE_DIR = None
+
     if args.setup:
         create_processor(PROJECT_ID, LOCATION)
         return
@@ -418,22 +809,34 @@ def main():
         mime_type = get_mime_type(args.file)
         print(f"Processing: {args.file} ({mime_type})")
 
+        output_file = os.path.splitext(args.file)[0] + ".md"
+        markdown = None
+
         # Check if PDF needs splitting
         if mime_type == "application/pdf":
-            reader = PdfReader(args.file)
-            num_pages = len(reader.pages)
-            print(f"PDF has {num_pages} pages")
-
-            if num_pages > 30:
-                print(f"Large PDF detected, will split into chunks...")
-                markdown = process_large_pdf(
-                    PROJECT_ID, LOCATION, processor_id, args.file, max_pages=25
-                )
-            else:
-                response = process_document_online(
-                    PROJECT_ID, LOCATION, processor_id, args.file, mime_type
-                )
-                markdown = document_to_markdown(response)
+            # Keep the PDF open so a split reuses this parse
+            with pikepdf.open(args.file) as pdf:
+                num_pages = get_pdf_page_count(pdf)
+                print(f"PDF has {num_pages} pages")
+
+                if num_pages > 30:
+                    # Chunks are written to output_file as they complete
+                    print(f"Large PDF detected, will split into chunks...")
+                    if args.batch:
+                        process_large_pdf_gcs(
+                            PROJECT_ID, LOCATION, processor_id, args.file, output_file,
+                            BUCKET, max_pages=25, pdf=pdf,
+                        )
+                    else:
+                        process_large_pdf(
+                            PROJECT_ID, LOCATION, processor_id, args.file, output_file,
+                            max_pages=25, pdf=pdf,
+                        )
+                else:
+                    response = process_document_online(
+                        PROJECT_ID, LOCATION, processor_id, args.file, mime_type
+                    )
+                    markdown = document_to_markdown(response)
         else:
             response = process_document_online(
                 PROJECT_ID, LOCATION, processor_id, args.file, mime_type
@@ -441,22 +844,25 @@ def main():
             markdown = document_to_markdown(response)
 
         # Save locally
-        output_file = os.path.splitext(args.file)[0] + ".md"
-        with open(output_file, "w") as f:
-            f.write(markdown)
+        if markdown is not None:
+            with open(output_file, "w") as f:
+                f.write(markdown)
         print(f"\n✓ Saved to {output_file}")
 
         # Preview
+        with open(output_file) as f:
+            preview = f.read(1000)
         print(f"\n{'='*60}")
         print("PREVIEW (first 1000 chars):")
         print(f"{'='*60}")
-        print(markdown[:1000])
+        print(preview)
     else:
         print("Usage:")
         print("  python layout_parser.py --setup              # Create processor")
         print("  python layout_parser.py --list-processors    # List processors")
         print("  python layout_parser.py --file doc.xlsx      # Process file")
         print("  python layout_parser.py --file doc.pdf --processor-id abc123")
+        print("  python layout_parser.py --file big.pdf --batch   # Large PDF via GCS batch")
 
 
 if __name__ == "__main__":
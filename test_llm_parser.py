@@ -154,12 +154,9 @@ def deduplicate_chunks(chunks: list[dict]) -> str:
     seen_lines = set()
 
     for chunk in chunks:
-        text = chunk['text'].strip()
         # Remove markdown code fence if present (LLM parser sometimes wraps in ```markdown)
-        if text.startswith('```markdown'):
-            text = text[len('```markdown'):].strip()
-        if text.endswith('```'):
-            text = text[:-3].strip()
+        text = chunk['text'].strip().removeprefix('```markdown').strip()
+        text = text.removesuffix('```').strip()
 
         # Split into lines and deduplicate
         for line in text.split('\n'):